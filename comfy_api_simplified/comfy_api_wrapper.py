@@ -1,15 +1,69 @@
-import json
 import requests
 import uuid
 import logging
 import websockets
 import asyncio
+import functools
+import itertools
+import socket
+from typing import List, Tuple
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 from requests.compat import urljoin, urlencode
-from comfy_api_simplified.comfy_workflow_wrapper import ComfyWorkflowWrapper
+from urllib3.util.retry import Retry
+from comfy_api_simplified.comfy_workflow_wrapper import ComfyWorkflowWrapper, _dumps, _loads
+
+try:
+    from requests_toolbelt import MultipartEncoder
+except ImportError:
+    MultipartEncoder = None
 
 logger = logging.getLogger(__name__)
 
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Status frames are small and previews are already compressed images, so
+# permessage-deflate only costs CPU; the larger max_size fits big preview frames.
+_WS_CONNECT_OPTIONS = {
+    "compression": None,
+    "max_size": 8 * 1024 * 1024,
+    "write_limit": 2**20,
+}
+
+# ComfyUI serializes every WebSocket event as {"type": ..., "data": ...}, so these
+# high-frequency events can be dropped by a prefix check without parsing the frame.
+_IGNORED_WS_PREFIXES = (
+    '{"type": "crystools.monitor"',
+    '{"type": "progress"',
+)
+
+def _on_execution_error(data: dict, prompt_id: str) -> bool:
+    if data["prompt_id"] == prompt_id:
+        raise Exception("Execution error occurred.")
+    return False
+
+
+def _on_status(data: dict, prompt_id: str) -> bool:
+    return data["status"]["exec_info"]["queue_remaining"] == 0
+
+
+def _on_executing(data: dict, prompt_id: str) -> bool:
+    return data["node"] is None and data["prompt_id"] == prompt_id
+
+
+def _on_execution_success(data: dict, prompt_id: str) -> bool:
+    return data["prompt_id"] == prompt_id
+
+
+# WebSocket event handlers, keyed by message type. A handler returns True
+# once the awaited prompt is finished.
+_WS_HANDLERS = {
+    "execution_error": _on_execution_error,
+    "status": _on_status,
+    "executing": _on_executing,
+    "execution_success": _on_execution_success,
+}
+
 class ComfyApiWrapper:
     def __init__(self, url: str = "http://127.0.0.1:8188", user: str = "", password: str = ""):
         """
@@ -34,14 +88,60 @@ class ComfyApiWrapper:
             ws_url_base = f"{ws_protocol}://{user}:{password}@{url_without_protocol}"
         else:
             ws_url_base = f"{ws_protocol}://{url_without_protocol}"
-        self.ws_url = urljoin(ws_url_base, "/ws?clientId={}")
+        ws_display_url_base = f"{ws_protocol}://{url_without_protocol.split('@')[-1]}"
+        # Escape "%" (e.g. percent-encoded credentials) so it survives %-formatting of the templates
+        self._ws_url_template = urljoin(ws_url_base.replace("%", "%%"), "/ws?clientId=%s")
+        # Same URL without any credentials, safe to log
+        self._ws_url_display_template = urljoin(ws_display_url_base.replace("%", "%%"), "/ws?clientId=%s")
+
+        # A persistent session keeps connections to the server alive between calls,
+        # so repeated /prompt, /history and /view requests skip the TCP/TLS handshake.
+        self._session = requests.Session()
+        self._session.auth = self.auth
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64,
+                              max_retries=Retry(total=3, backoff_factor=0.2))
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        # Generated client IDs: one random prefix per wrapper plus a counter, so they
+        # stay unique on the server without a urandom read per prompt
+        self._client_prefix = uuid.uuid4().hex
+        self._client_counter = itertools.count()
+
+        # Event loop reused by the synchronous wrappers, created on first use
+        self._loop = None
+
+    def close(self):
+        """
+        Closes the underlying HTTP session, its pooled connections and the internal event loop.
+        """
+        self._session.close()
+        if self._loop is not None:
+            self._loop.close()
+            self._loop = None
+
+    def _run_sync(self, coro):
+        """
+        Runs a coroutine to completion from synchronous code.
+
+        A single event loop is kept for the lifetime of the wrapper instead of creating
+        one per call. If a loop is already running (e.g. patched with nest_asyncio),
+        the coroutine is run on it as before.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+            loop = self._loop
+        return loop.run_until_complete(coro)
 
     def queue_prompt(self, prompt: dict, client_id: str = None) -> dict:
         """
         Queues a prompt for execution.
 
         Args:
-            prompt (dict): The prompt to be executed.
+            prompt (dict): The prompt to be executed, either a plain dict or a ComfyWorkflowWrapper.
             client_id (str): The client ID for the prompt. Defaults to None.
 
         Returns:
@@ -50,19 +150,51 @@ class ComfyApiWrapper:
         Raises:
             Exception: If the request fails with a non-200 status code.
         """
-        p = {"prompt": prompt}
-        logging.info(f"Posting prompt for client {client_id}")
-        if client_id:
-            p["client_id"] = client_id
-        data = json.dumps(p).encode("utf-8")
-        logger.debug(f"Posting prompt to {self.url}/prompt")
-        resp = requests.post(urljoin(self.url, "/prompt"), data=data, auth=self.auth)
-        logger.debug(f"{resp.status_code}: {resp.reason}")
+        logger.info("Posting prompt for client %s", client_id)
+        if isinstance(prompt, ComfyWorkflowWrapper):
+            # Serialize the nodes straight into the request envelope
+            data = b'{"prompt":' + prompt.dumps()
+            if client_id:
+                data += b',"client_id":' + _dumps(client_id)
+            data += b"}"
+        else:
+            p = {"prompt": prompt}
+            if client_id:
+                p["client_id"] = client_id
+            data = _dumps(p)
+        logger.debug("Posting prompt to %s/prompt", self.url)
+        resp = self._session.post(urljoin(self.url, "/prompt"), data=data, headers=_JSON_HEADERS)
+        logger.debug("%s: %s", resp.status_code, resp.reason)
         if resp.status_code == 200:
-            return resp.json()
+            return _loads(resp.content)
         else:
             raise Exception(f"Request failed with status code {resp.status_code}: {resp.reason}")
 
+    async def _run_in_executor(self, func, *args):
+        """
+        Runs a blocking session call in the event loop's default executor,
+        so the loop stays free to serve other coroutines during the request.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args))
+
+    async def _queue_prompt_async(self, prompt: dict, client_id: str = None) -> dict:
+        return await self._run_in_executor(self.queue_prompt, prompt, client_id)
+
+    async def _get_history_async(self, prompt_id: str) -> dict:
+        return await self._run_in_executor(self.get_history, prompt_id)
+
+    def _tune_ws_socket(self, websocket):
+        """
+        Applies socket-level options to an open WebSocket connection.
+        """
+        sock = websocket.transport.get_extra_info("socket")
+        if sock is None:
+            return
+        # Send small control frames immediately. asyncio's own transports already do this,
+        # other event loop implementations may not.
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
     async def queue_prompt_and_wait(self, prompt: dict, client_id = None) -> str:
         """
         Queues a prompt for execution and waits for the result.
@@ -78,62 +210,105 @@ class ComfyApiWrapper:
         """
         
         if client_id is None:
-            client_id = str(uuid.uuid4())
+            client_id = f"{self._client_prefix}-{next(self._client_counter):x}"
         
-        logging.info(f"Client ID: {client_id}")
+        logger.info("Client ID: %s", client_id)
             
-        resp = self.queue_prompt(prompt, client_id)
+        resp = await self._queue_prompt_async(prompt, client_id)
         
         prompt_id = resp["prompt_id"]
-        logger.debug(f"Connecting to {self.ws_url.format(client_id).split('@')[-1]}")
-        async with websockets.connect(uri=self.ws_url.format(client_id)) as websocket:
-            while True:
-                # out = ws.recv()
-                out = await websocket.recv()
-                if isinstance(out, str):
-                    message = json.loads(out)
-                    if message["type"] == "crystools.monitor":
-                        continue
-                    logger.debug(message)
-                    if message["type"] == "execution_error":
-                        data = message["data"]
-                        if data["prompt_id"] == prompt_id:
-                            raise Exception("Execution error occurred.")
-                    if message["type"] == "status":
-                        data = message["data"]
-                        if data["status"]["exec_info"]["queue_remaining"] == 0:
-                            return prompt_id
-                    if message["type"] == "executing":
+        ws_url = self._ws_url_template % client_id
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Connecting to %s", self._ws_url_display_template % client_id)
+        seen_prompt = False
+        try:
+            async with websockets.connect(uri=ws_url, **_WS_CONNECT_OPTIONS) as websocket:
+                self._tune_ws_socket(websocket)
+                while True:
+                    out = await websocket.recv()
+                    # Binary frames carry previews, which are never needed here
+                    if isinstance(out, str) and not out.startswith(_IGNORED_WS_PREFIXES):
+                        message = _loads(out)
+                        message_type = message["type"]
+                        if message_type == "crystools.monitor":
+                            continue
+                        logger.debug(message)
                         data = message["data"]
-                        if data["node"] is None and data["prompt_id"] == prompt_id:
+                        if not seen_prompt and isinstance(data, dict) and data.get("prompt_id") == prompt_id:
+                            seen_prompt = True
+                        handler = _WS_HANDLERS.get(message_type)
+                        if handler is not None and handler(data, prompt_id):
                             return prompt_id
+        except websockets.exceptions.ConnectionClosed:
+            # The server already ran our prompt; it may have finished right before the connection dropped
+            if not seen_prompt:
+                raise
+            logger.info("Connection closed while waiting for prompt %s, checking history", prompt_id)
+            history = await self._get_history_async(prompt_id)
+            if prompt_id not in history:
+                raise
+            # Failed prompts are recorded in the history too
+            if history[prompt_id]["status"]["status_str"] != "success":
+                raise Exception("Execution error occurred.")
+            return prompt_id
+
+    async def queue_and_wait_images_async(self, prompt: ComfyWorkflowWrapper, output_node_ids: List[str],
+                                          client_id = None) -> dict:
+        """
+        Queues a prompt with a ComfyWorkflowWrapper object and waits for the images to be generated.
+        Unlike queue_and_wait_images, this method can be awaited from a running event loop.
+
+        Args:
+            prompt (ComfyWorkflowWrapper): The ComfyWorkflowWrapper object representing the prompt.
+            output_node_ids (List[str]): The IDs of the output nodes.
+            client_id (str): The client ID for the prompt. Defaults to None.
+
+        Returns:
+            dict: A dictionary mapping output node IDs to their outputs.
+
+        Raises:
+            Exception: If the request fails with a non-200 status code.
+        """
+        prompt_id = await self.queue_prompt_and_wait(prompt, client_id=client_id)
+        prompt_result = (await self._get_history_async(prompt_id))[prompt_id]
+
+        wanted = frozenset(output_node_ids)
+        return {node_id: output for node_id, output in prompt_result["outputs"].items() if node_id in wanted}
+
+    async def queue_and_wait_many(self, prompts: List[Tuple[ComfyWorkflowWrapper, List[str]]]) -> List[dict]:
+        """
+        Queues several prompts at once and waits for all of them to finish.
+        Each prompt gets its own client ID and WebSocket, and HTTP requests share the pooled session.
+
+        Args:
+            prompts (List[Tuple[ComfyWorkflowWrapper, List[str]]]): Pairs of workflow and output node IDs.
 
-    def queue_and_wait_images(self, prompt: ComfyWorkflowWrapper, output_node_ids: list[str],
+        Returns:
+            List[dict]: The outputs of each prompt, in the same order as the input.
+
+        Raises:
+            Exception: If any request fails or an execution error occurs.
+        """
+        return await asyncio.gather(
+            *(self.queue_and_wait_images_async(prompt, output_node_ids) for prompt, output_node_ids in prompts))
+
+    def queue_and_wait_images(self, prompt: ComfyWorkflowWrapper, output_node_ids: List[str],
                               client_id = None) -> dict:
         """
         Queues a prompt with a ComfyWorkflowWrapper object and waits for the images to be generated.
 
         Args:
             prompt (ComfyWorkflowWrapper): The ComfyWorkflowWrapper object representing the prompt.
-            output_node_id (str): The title of the output node.
+            output_node_ids (List[str]): The IDs of the output nodes.
+            client_id (str): The client ID for the prompt. Defaults to None.
 
         Returns:
-            dict: A dictionary mapping image filenames to their content.
+            dict: A dictionary mapping output node IDs to their outputs.
 
         Raises:
             Exception: If the request fails with a non-200 status code.
         """
-        loop = asyncio.get_event_loop() 
-        prompt_id = loop.run_until_complete(self.queue_prompt_and_wait(prompt, client_id=client_id))
-        prompt_result = self.get_history(prompt_id)[prompt_id]
-        
-        outputs = prompt_result["outputs"]
-        keys = list(outputs.keys())
-        for node_id in keys:
-            if node_id not in output_node_ids:
-                del outputs[node_id]                    
-               
-        return prompt_result["outputs"]
+        return self._run_sync(self.queue_and_wait_images_async(prompt, output_node_ids, client_id=client_id))
 
     def get_history(self, prompt_id: str) -> dict:
         """
@@ -149,10 +324,10 @@ class ComfyApiWrapper:
             Exception: If the request fails with a non-200 status code.
         """
         url = urljoin(self.url, f"/history/{prompt_id}")
-        logger.debug(f"Getting history from {url}")
-        resp = requests.get(url, auth=self.auth)
+        logger.debug("Getting history from %s", url)
+        resp = self._session.get(url)
         if resp.status_code == 200:
-            return resp.json()
+            return _loads(resp.content)
         else:
             raise Exception(f"Request failed with status code {resp.status_code}: {resp.reason}")
 
@@ -173,9 +348,9 @@ class ComfyApiWrapper:
         """
         params = {"filename": filename, "subfolder": subfolder, "type": folder_type}
         url = urljoin(self.url, f"/view?{urlencode(params)}")
-        logger.info(f"Getting image from {url}")
-        resp = requests.get(url, auth=self.auth)
-        logger.info(f"{resp.status_code}: {resp.reason}")
+        logger.info("Getting image from %s", url)
+        resp = self._session.get(url)
+        logger.info("%s: %s", resp.status_code, resp.reason)
         if resp.status_code == 200:
             return resp.content
         else:
@@ -198,11 +373,17 @@ class ComfyApiWrapper:
         url = urljoin(self.url, "/upload/image")
         serv_file = filename.split("/")[-1]
         data = {"subfolder": subfolder}
-        files = {"image": (serv_file, open(filename, "rb"))}
-        logger.info(f"Posting {filename} to {url} with data {data}")
-        resp = requests.post(url, files=files, data=data, auth=self.auth)
-        logger.info(f"{resp.status_code}: {resp.reason}, {resp.text}")
+        logger.info("Posting %s to %s with data %s", filename, url, data)
+        with open(filename, "rb") as fh:
+            image = (serv_file, fh, "application/octet-stream")
+            if MultipartEncoder is not None:
+                # Stream the multipart body from disk instead of building it in memory
+                encoder = MultipartEncoder(fields={**data, "image": image})
+                resp = self._session.post(url, data=encoder, headers={"Content-Type": encoder.content_type})
+            else:
+                resp = self._session.post(url, files={"image": image}, data=data)
+        logger.info("%s: %s, %s", resp.status_code, resp.reason, resp.text)
         if resp.status_code == 200:
-            return resp.json()
+            return _loads(resp.content)
         else:
             raise Exception(f"Request failed with status code {resp.status_code}: {resp.reason}")
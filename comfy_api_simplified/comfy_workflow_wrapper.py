@@ -1,68 +1,228 @@
 import json
 import logging
-from typing import Any, List, Union
+import mmap
+import os
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple, Union
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+    _loads_accepts_buffer = True
+
+    def _dumps_indented(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    try:
+        # SIMD-accelerated parsing for workflow loads when orjson is unavailable
+        import simdjson
+
+        _loads = simdjson.loads
+        _loads_accepts_buffer = True
+    except ImportError:
+        _loads = json.loads
+        _loads_accepts_buffer = False
+
+    # Reused encoders; non-ASCII text is written as UTF-8 instead of being escaped, like orjson does
+    _encode = json.JSONEncoder(ensure_ascii=False).encode
+    _encode_indented = json.JSONEncoder(indent=2, ensure_ascii=False).encode
+
+    def _dumps(obj) -> bytes:
+        return _encode(obj).encode("utf-8")
+
+    def _dumps_indented(obj) -> bytes:
+        return _encode_indented(obj).encode("utf-8")
 
 logger = logging.getLogger(__name__)
 
+# Files above this size are parsed straight from a memory map instead of being read into a buffer
+_MMAP_THRESHOLD = 64 * 1024
+
+
+def _load_file(path: str):
+    """
+    Parse a JSON file, memory-mapping large files when the parser accepts buffers.
+    """
+    with open(path, "rb") as f:
+        if not _loads_accepts_buffer or os.fstat(f.fileno()).st_size <= _MMAP_THRESHOLD:
+            return _loads(f.read())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            return _loads(view)
+
+
+def _write_file(path: str, data: bytes):
+    """
+    Write bytes to a file with raw os.write calls, bypassing Python's buffered IO.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def _loads_if_serialized(value):
+    """
+    Parse JSON given as a string or bytes, pass already-built objects through.
+    """
+    if isinstance(value, (str, bytes, bytearray)):
+        return _loads(value)
+    return value
+
+
+# Conversions applied by set_node_param, keyed by the exact type of the current value.
+# Numbers and strings are stored as given: a whole-number cfg may be saved as an int.
+_CASTERS = {
+    bool: bool,
+    list: _loads_if_serialized,
+    dict: _loads_if_serialized,
+}
+
 class ComfyWorkflowWrapper(dict):
-    def __init__(self, workflow_data: Union[str, dict]):
+    def __init__(self, workflow_data: Union[str, bytes, dict]):
         """
         Initialize the ComfyWorkflowWrapper object.
 
         Args:
-            workflow_data (str): The path to the workflow file or a JSON string representing the workflow.
+            workflow_data (Union[str, bytes, dict]): The path to the workflow file, a JSON string (or bytes)
+                representing the workflow, or the workflow dictionary itself.
         """
         if isinstance(workflow_data, dict):
             workflow_dict = workflow_data
+        elif isinstance(workflow_data, (bytes, bytearray)):
+            workflow_dict = _loads(workflow_data)
         elif isinstance(workflow_data, str):
-            if workflow_data.startswith("{"):
+            if workflow_data.lstrip().startswith("{"):
                 # If the input is a JSON string
-                workflow_dict = json.loads(workflow_data)
+                workflow_dict = _loads(workflow_data)
             else:
                 # If the input is a file path
-                with open(workflow_data) as f:
-                    workflow_str = f.read()
-                    workflow_dict = json.loads(workflow_str)
+                workflow_dict = _load_file(workflow_data)
         else:
             raise TypeError("Expected a dictionary")
         super().__init__(workflow_dict)
+        # Title -> ID index, built on the first get_node_id call
+        self._title_to_id: Optional[Dict[str, str]] = None
 
-    def list_nodes(self) -> List[str]:
+    @classmethod
+    def from_dict(cls, workflow_dict: Dict[str, dict]) -> "ComfyWorkflowWrapper":
         """
-        Get a list of node titles in the workflow.
+        Wrap a workflow dictionary without the input type checks of __init__.
+
+        Args:
+            workflow_dict (Dict[str, dict]): The workflow dictionary.
+
+        Returns:
+            ComfyWorkflowWrapper: The wrapped workflow.
+        """
+        obj = cls.__new__(cls)
+        dict.__init__(obj, workflow_dict)
+        obj._title_to_id = None
+        return obj
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._invalidate()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._invalidate()
+
+    def _invalidate(self):
+        """
+        Drop cached data derived from the set of nodes, after nodes were added, removed or replaced.
+        """
+        self._title_to_id = None
+
+    def dumps(self) -> bytes:
+        """
+        Serialize the workflow to compact JSON.
 
         Returns:
-            List[Tuple(str, str)]: A list of node IDs and titles.
+            bytes: The JSON-encoded workflow.
         """
-        return [(id, value["_meta"]["title"]) for id, value in super().items()]
+        return _dumps(self)
+
+    def list_nodes(self) -> Iterator[Tuple[str, str]]:
+        """
+        Iterate over the node IDs and titles in the workflow.
+        Wrap the result in list() if you need to index it or iterate it more than once.
+
+        Returns:
+            Iterator[Tuple[str, str]]: An iterator of node IDs and titles.
+        """
+        return ((id, node["_meta"]["title"]) for id, node in dict.items(self))
 
     def set_node_param(self, id: str, param: str, value):
         """
         Set the value of a parameter for a specific node.
-        Mind that this method will change parameters for ALL nodes with the same title.
 
         Args:
-            id (str): The I        param (str): The name of the parameter.
+            id (str): The ID of the node.
+            param (str): The name of the parameter.
             value: The value to set.
 
         Raises:
-            ValueError: If the no    """
-        smth_changed = False
+            ValueError: If the node is not found.
+        """
         id = str(id)
-        if id in self:
-            node = self[id]
-            orig_value = node["inputs"][param]
-            if isinstance(orig_value, (int, float)):
-                node["inputs"][param] = value
-            elif isinstance(orig_value, bool):
-                node["inputs"][param] = bool(value)
-            elif isinstance(orig_value, list):
-                node["inputs"][param] = json.loads(value)
-            else:
-                node["inputs"][param] = value
-            smth_changed = True
-        if not smth_changed:
+        if id not in self:
             raise ValueError(f"Node '{id}' not found.")
+        inputs = self[id]["inputs"]
+        caster = _CASTERS.get(type(inputs[param]))
+        inputs[param] = value if caster is None else caster(value)
+
+    def set_params(self, updates: Dict[str, Dict[str, Any]]):
+        """
+        Set several parameters, possibly of several nodes, in one call.
+        Updates are applied in order and are not rolled back: if a node or parameter is missing,
+        the updates made before it stay applied.
+
+        Args:
+            updates (Dict[str, Dict[str, Any]]): A mapping of node IDs to mappings of parameter names to values.
+
+        Raises:
+            ValueError: If a node is not found.
+        """
+        for id, params in updates.items():
+            id = str(id)
+            if id not in self:
+                raise ValueError(f"Node '{id}' not found.")
+            # One lookup of the inputs for all parameters of the node
+            inputs = self[id]["inputs"]
+            for param, value in params.items():
+                caster = _CASTERS.get(type(inputs[param]))
+                inputs[param] = value if caster is None else caster(value)
+
+    def setter_for(self, id: str, param: str) -> Callable[[Any], None]:
+        """
+        Get a function that sets one parameter of a specific node.
+        The type conversion is resolved once, which makes it cheaper than calling
+        set_node_param repeatedly, e.g. in a parameter sweep.
+
+        Args:
+            id (str): The ID of the node.
+            param (str): The name of the parameter.
+
+        Returns:
+            Callable[[Any], None]: A function taking the value to set.
+
+        Raises:
+            ValueError: If the node is not found.
+        """
+        id = str(id)
+        if id not in self:
+            raise ValueError(f"Node '{id}' not found.")
+        caster = _CASTERS.get(type(self[id]["inputs"][param]))
+
+        def setter(value):
+            # Look the node up on each call, so a replaced node is still written to
+            self[id]["inputs"][param] = value if caster is None else caster(value)
+
+        return setter
 
     def get_node_param(self, id: str, param: str) -> Any:
         """
@@ -96,40 +256,42 @@ class ComfyWorkflowWrapper(dict):
         Raises:
             ValueError: If the node is not found.
         """
-        for id, node in super().items():
-            if node["_meta"]["title"] == title:
-                return id
-        raise ValueError(f"Node '{title}' not found.")
+        if self._title_to_id is None:
+            # Keep the first node for duplicated titles, skip nodes without metadata
+            self._title_to_id = {}
+            for id, node in dict.items(self):
+                if "_meta" in node:
+                    self._title_to_id.setdefault(node["_meta"]["title"], id)
+        try:
+            return self._title_to_id[title]
+        except KeyError:
+            raise ValueError(f"Node '{title}' not found.") from None
     
     def prune(workflow, output_nodes, no_cache):
-        # Perform a depth-first search to find all required nodes
-        required_nodes = set()
-        visited_nodes = set()
-
-        def dfs(node_id):
-            if node_id in visited_nodes:
-                return
-            visited_nodes.add(node_id)
+        # Perform an iterative depth-first search, copying each required node into
+        # the pruned workflow as it is reached; the result doubles as the visited set.
+        # Seeds and inputs are pushed in reverse, so nodes come out in the order they are listed.
+        pruned_workflow = {}
+        # Normalize once: duplicates and int/str spellings of an ID share one seed, first mention wins
+        stack = list(dict.fromkeys(str(node_id) for node_id in output_nodes))
+        stack.reverse()
+        push = stack.append
+        while stack:
+            node_id = stack.pop()
+            if node_id in pruned_workflow:
+                continue
+            node = pruned_workflow[node_id] = workflow[node_id]
 
-            node = workflow[node_id]
             if node["class_type"] == "AnythingCache" and not no_cache:
-                required_nodes.add(node_id)
-                return
-
-            for input_value in node["inputs"].values():
-                if isinstance(input_value, list) and len(input_value) == 2:
-                    input_node_id = str(input_value[0])
-                    dfs(input_node_id)
-
-            required_nodes.add(node_id)
-
-        for output_node in output_nodes:
-            dfs(output_node)
+                continue
 
-        # Remove unnecessary nodes from the workflow
-        pruned_workflow = {node_id: node for node_id, node in workflow.items() if node_id in required_nodes}
+            for input_value in reversed(node["inputs"].values()):
+                if type(input_value) is list and len(input_value) == 2:
+                    # Link IDs are almost always strings already
+                    input_node_id = input_value[0]
+                    push(input_node_id if type(input_node_id) is str else str(input_node_id))
 
-        return ComfyWorkflowWrapper(pruned_workflow)
+        return ComfyWorkflowWrapper.from_dict(pruned_workflow)
 
     def save_to_file(self, path: str):
         """
@@ -138,6 +300,4 @@ class ComfyWorkflowWrapper(dict):
         Args:
             path (str): The path to save the workflow file.
         """
-        workflow_str = json.dumps(self, indent=4)
-        with open(path, "w+") as f:
-            f.write(workflow_str)
+        _write_file(path, _dumps_indented(self))